@@ -30,6 +30,7 @@ Defines the signals linked to buttons and keyboard events for main window of the
 """
 
 from PyQt4 import QtGui, QtCore, uic
+from functools import partial
 import sys
 import camIRPelcoD
 import thermaCam
@@ -51,6 +52,9 @@ class camIRMain(QtGui.QMainWindow):
     
     initCamera : uses the camIRPelcoD module to create a camera object.
     
+    initThermaCam : uses the thermaCam module to create a thermacam object, and the
+    commandScheduler which sends all of its commands.
+    
     sendPreset : uses the camIRPelcoD module to set/go to/clear presets.
     
     newOnkeyPressEvent : uses the keyboard "pressed" events to control the tourelle.
@@ -82,11 +86,12 @@ class camIRMain(QtGui.QMainWindow):
         QtCore.QObject.connect(self.ValidPreset, QtCore.SIGNAL(("pressed()")), self.sendPreset)
         
     def thermaBtnDefinition(self):
-        QtCore.QObject.connect(self.btnFocusInf, QtCore.SIGNAL(("pressed()")), self.a40.focusInf)
-        QtCore.QObject.connect(self.btnFocusInf, QtCore.SIGNAL(("released()")), self.a40.focusStop)
-        QtCore.QObject.connect(self.btnFocusClose, QtCore.SIGNAL(("pressed()")), self.a40.focusClose)
-        QtCore.QObject.connect(self.btnFocusClose, QtCore.SIGNAL(("released()")), self.a40.focusStop)
-        self.btnFocusZoom.clicked.connect(self.a40.autofocus)
+        #Commands go through the scheduler, so they can be sent during an image transfer
+        QtCore.QObject.connect(self.btnFocusInf, QtCore.SIGNAL(("pressed()")), partial(self.link.submit, self.a40.focusInf))
+        QtCore.QObject.connect(self.btnFocusInf, QtCore.SIGNAL(("released()")), partial(self.link.submit, self.a40.focusStop))
+        QtCore.QObject.connect(self.btnFocusClose, QtCore.SIGNAL(("pressed()")), partial(self.link.submit, self.a40.focusClose))
+        QtCore.QObject.connect(self.btnFocusClose, QtCore.SIGNAL(("released()")), partial(self.link.submit, self.a40.focusStop))
+        self.btnFocusZoom.clicked.connect(self.autofocus)
         
         #zoom
         self.btnZoom.clicked.connect(self.zoom)
@@ -106,6 +111,7 @@ class camIRMain(QtGui.QMainWindow):
         
     def initThermaCam(self):
         self.a40 = thermaCam.thermacam(self.serialThermaList.currentText())
+        self.link = thermaCam.commandScheduler(self.a40)
         self.thermaBtnDefinition()
     
     def sendPreset(self):
@@ -138,38 +144,36 @@ class camIRMain(QtGui.QMainWindow):
         if not e.isAutoRepeat():
             self.camera1.stop()
             
+    def autofocus(self):
+        self.link.submit(self.a40.autofocus)
+        
     def zoom(self):
-        self.a40.zoom(float(self.zoomPower.value()))
+        self.link.submit(self.a40.zoom, float(self.zoomPower.value()))
         
     def rangeTemp(self):
-        self.a40.setRange(float(self.lowTemp.value()), float(self.highTemp.value()))
+        self.link.submit(self.a40.setRange, float(self.lowTemp.value()), float(self.highTemp.value()))
     
     def rangeTempAuto(self):
-        self.a40.autoAdj('on')
+        self.link.submit(self.a40.autoAdj, 'on')
+    
+    def removeImage(self, imgName):
+        cmdToSend = 'rm ' + imgName
+        self.a40.writeCmd('cd \images')
+        self.a40.writeCmd(cmdToSend)
     
     def doImgAction(self):
         actionImg = str(self.getOrSave.currentText())
         imgName = str(self.imgName.text())
         if actionImg == "Save Image":
-            self.a40.saveImage(imgName)
+            self.link.call(self.a40.saveImage, imgName)
         elif actionImg == "Get Image":
-            self.a40.getImage(imgName)
+            #Transfer goes on in the background, the list of images does not change
+            self.link.getImage(imgName)
+            return
         elif actionImg == "Remove Image":
-            cmdToSend = 'rm ' + imgName
-            self.a40.writeCmd('cd \images')
-            self.a40.writeCmd(cmdToSend)
-        self.a40.uart.open()
-        self.a40.uart.write(('\rls \\images\r').encode('utf-8'))
-        listOfImages = []
-        listOfFiles = self.a40.uart.readall().decode('utf-8')
-        for a in listOfFiles.split():
-            if a.endswith('.jpg'):
-                listOfImages.append(a)
-        
-        print(listOfFiles)
-        print(listOfImages)
+            self.link.call(self.removeImage, imgName)
+        listOfImages = self.link.call(self.a40.listImages)
         self.imgList.setPlainText(str(listOfImages))
-        self.a40.uart.close()
             
 if __name__ == "__main__":
     app = QtGui.QApplication(sys.argv)
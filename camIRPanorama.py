@@ -0,0 +1,284 @@
+#-*-coding:Utf-8 -*
+
+"""
+    Copyright (C) 2017 Cazé-François Guillaume
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 2 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License along
+    with this program; if not, write to the Free Software Foundation, Inc.,
+    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+This module builds thermal panoramas : the tourelle is moved over a grid of pan/tilt
+positions, a frame is taken at each one, and the frames are placed in a mosaic from their
+known angles.
+
+The transfer of a frame goes on while the tourelle moves to the next position, and each
+frame is added to the mosaic as soon as it is transfered.
+
+Classes
+-------
+mosaic : the panorama image, built frame by frame
+
+sweep : the grid of positions, the tourelle and the thermal camera
+
+Example
+-------
+from camIRPelcoD import camera
+from thermaCam import thermacam, commandScheduler
+from camIRPanorama import sweep
+
+tourelle = camera(port_tourelle, receiver_address)
+link = commandScheduler(thermacam(port_camera))
+pano = sweep.grid(tourelle, link, 0, 120, -10, 10)
+pano.run('pano')
+pano.mosaic.save('pano.png')
+"""
+
+import concurrent.futures
+import csv
+import time
+
+#External libraries numpy and pillow
+import numpy as np
+from PIL import Image
+
+from thermaStats import loadImage
+
+
+class mosaic():
+    """
+    Panorama image built from frames tagged with their pan/tilt position.
+
+    Each frame is weighted by its distance to its own borders, so overlapping frames
+    are blended without visible seams.
+
+    Attributes
+    ----------
+    self.panMin, self.tiltMin : position of the top left frame, in degrees
+
+    self.panMax, self.tiltMax : position of the bottom right frame, in degrees
+
+    self.fov : (horizontal, vertical) field of view of the camera, in degrees
+
+    self.total : weighted sum of the frames
+
+    self.weights : sum of the weights
+
+    Functions
+    ---------
+    add(pixels, pan, tilt) : places a frame in the mosaic
+
+    image : the blended mosaic, as grey levels
+
+    save(fileName) : saves the mosaic as an image file
+    """
+    def __init__(self, panMin, panMax, tiltMin, tiltMax, fov=(24, 18)):
+        self.panMin = panMin
+        self.panMax = panMax
+        self.tiltMin = tiltMin
+        self.tiltMax = tiltMax
+        self.fov = fov
+        self.total = None
+        self.weights = None
+        self.feather = None
+
+    def allocate(self, shape):
+        """
+        Creates the canvas, once the size of the frames is known.
+        """
+        height, width = shape
+        self.pixelsPerDegree = (width / self.fov[0], height / self.fov[1])
+        canvasWidth = int(round((self.panMax - self.panMin) * self.pixelsPerDegree[0])) + width
+        canvasHeight = int(round((self.tiltMax - self.tiltMin) * self.pixelsPerDegree[1])) + height
+        self.total = np.zeros((canvasHeight, canvasWidth), dtype=np.float32)
+        self.weights = np.zeros((canvasHeight, canvasWidth), dtype=np.float32)
+        featherX = np.minimum(np.arange(1, width + 1), np.arange(width, 0, -1)).astype(np.float32)
+        featherY = np.minimum(np.arange(1, height + 1), np.arange(height, 0, -1)).astype(np.float32)
+        self.feather = np.outer(featherY, featherX)
+
+    def add(self, pixels, pan, tilt):
+        """
+        Places a frame in the mosaic.
+
+        Parameters
+        ----------
+        pixels : 2D array of the frame
+
+        pan, tilt : position of the tourelle when the frame was taken, in degrees.
+        Tilt values grow downwards.
+        """
+        if self.total is None:
+            self.allocate(pixels.shape)
+        height, width = self.feather.shape
+        x = int(round((pan - self.panMin) * self.pixelsPerDegree[0]))
+        y = int(round((tilt - self.tiltMin) * self.pixelsPerDegree[1]))
+        self.total[y:y + height, x:x + width] += pixels[:height, :width] * self.feather
+        self.weights[y:y + height, x:x + width] += self.feather
+
+    def image(self):
+        blended = np.zeros_like(self.total)
+        np.divide(self.total, self.weights, out=blended, where=self.weights > 0)
+        return np.clip(blended, 0, 255).astype(np.uint8)
+
+    def save(self, fileName):
+        Image.fromarray(self.image()).save(fileName)
+
+
+class sweep():
+    """
+    Sweep of the tourelle over a grid of positions, taking a frame at each one.
+
+    Rows are swept alternately left to right and right to left, so the tourelle
+    never comes back across the whole panorama.
+
+    Attributes
+    ----------
+    self.tourelle : camIRPelcoD.camera object
+
+    self.link : thermaCam.commandScheduler of the thermal camera
+
+    self.pans, self.tilts : positions of the grid, in degrees
+
+    self.settle : waiting time after each move, before taking the frame
+
+    self.retries : number of new attempts when a move times out
+
+    self.frames : list of (image name, pan, tilt) of the frames taken
+
+    self.failed : list of the image names which could not be transfered or decoded
+
+    self.mosaic : mosaic object
+
+    Functions
+    ---------
+    grid(...) : creates a sweep covering a pan/tilt area with overlapping frames
+
+    positions : list of the positions, in sweeping order
+
+    run(prefix) : moves the tourelle, takes and transfers the frames, builds the mosaic
+
+    saveTags(fileName) : writes the position of each frame into another CSV file
+    """
+    def __init__(self, tourelle, link, pans, tilts, fov=(24, 18), settle=0.5, retries=1):
+        self.tourelle = tourelle
+        self.link = link
+        self.pans = list(pans)
+        self.tilts = list(tilts)
+        self.settle = settle
+        self.retries = retries
+        self.frames = []
+        self.failed = []
+        self.tagFile = None
+        self.tags = None
+        self.mosaic = mosaic(min(self.pans), max(self.pans), min(self.tilts), max(self.tilts), fov)
+
+    @classmethod
+    def grid(cls, tourelle, link, panStart, panStop, tiltStart, tiltStop, fov=(24, 18),
+             overlap=0.2, settle=0.5, retries=1):
+        """
+        Creates a sweep covering the area from (panStart, tiltStart) to (panStop, tiltStop),
+        the frames overlapping by overlap (from 0 to 1) of the field of view.
+        The stop positions may be lower than the start positions.
+        """
+        if not 0 <= overlap < 1:
+            raise ValueError("overlap must be between 0 and 1, not " + str(overlap))
+        panStep = fov[0] * (1 - overlap)
+        tiltStep = fov[1] * (1 - overlap)
+        if panStop < panStart:
+            panStep = -panStep
+        if tiltStop < tiltStart:
+            tiltStep = -tiltStep
+        pans = np.arange(panStart, panStop + panStep / 2, panStep)
+        tilts = np.arange(tiltStart, tiltStop + tiltStep / 2, tiltStep)
+        return cls(tourelle, link, pans.tolist(), tilts.tolist(), fov, settle, retries)
+
+    def positions(self):
+        positions = []
+        for row, tilt in enumerate(self.tilts):
+            pans = self.pans if row % 2 == 0 else self.pans[::-1]
+            for pan in pans:
+                positions.append((pan, tilt))
+        return positions
+
+    def run(self, prefix):
+        """
+        Sweeps the grid. Images are named prefix_0.jpg, prefix_1.jpg...
+
+        The transfer of each frame is queued on the scheduler, and the tourelle moves
+        to the next position without waiting for it.
+
+        A frame is only taken once the tourelle has reached its position : if a move still
+        times out after self.retries new attempts, the sweep stops with a TimeoutError.
+
+        The position of each frame is written into prefix.csv as soon as the frame is
+        transfered. If the sweep stops, the frames already taken are still transfered
+        and tagged. Frames which fail are listed in self.failed and left out of the mosaic.
+
+        Returns
+        -------
+        the mosaic object
+        """
+        pending = []
+        with open(prefix + '.csv', 'w', newline='') as csvFile:
+            self.tagFile = csvFile
+            self.tags = csv.writer(csvFile)
+            self.tags.writerow(['image', 'pan', 'tilt'])
+            try:
+                for number, (pan, tilt) in enumerate(self.positions()):
+                    self.reach(pan, tilt)
+                    time.sleep(self.settle)
+                    name = prefix + '_' + str(number) + '.jpg'
+                    self.link.call(self.link.cam.saveImage, name)
+                    pending.append((self.link.getImage(name), name, pan, tilt))
+                    pending = self.collect(pending)
+            finally:
+                concurrent.futures.wait([job for job, name, pan, tilt in pending])
+                self.collect(pending)
+                self.tagFile = None
+                self.tags = None
+        return self.mosaic
+
+    def reach(self, pan, tilt):
+        for attempt in range(self.retries + 1):
+            if self.tourelle.goTo(pan, tilt):
+                return
+        raise TimeoutError("Position pan " + str(pan) + ", tilt " + str(tilt) + " not reached")
+
+    def collect(self, pending):
+        """
+        Tags the transfered frames and adds them to the mosaic, returns the frames still
+        being transfered. The error of a failed transfer is already printed by the scheduler.
+        """
+        waiting = []
+        for job, name, pan, tilt in pending:
+            if not job.done():
+                waiting.append((job, name, pan, tilt))
+                continue
+            if job.exception() is not None:
+                self.failed.append(name)
+                continue
+            self.frames.append((name, pan, tilt))
+            self.tags.writerow([name, pan, tilt])
+            self.tagFile.flush()
+            try:
+                self.mosaic.add(loadImage(name), pan, tilt)
+            except (OSError, ValueError) as error:
+                print("Frame " + name + " not added to the mosaic : " + str(error))
+                self.failed.append(name)
+        return waiting
+
+    def saveTags(self, fileName):
+        with open(fileName, 'w', newline='') as csvFile:
+            writer = csv.writer(csvFile)
+            writer.writerow(['image', 'pan', 'tilt'])
+            writer.writerows(self.frames)
@@ -43,12 +43,17 @@ my_camera = camera(port_id, receiver_address)
 my_camera.left()
 #stop rotation
 my_camera.stop()
+
+#point tourelle at pan 120°, tilt -10°, and wait for the end of the move
+my_camera.goTo(120, -10)
 """
 
 #External library pyserial
 #
 #https://pythonhosted.org/pyserial/
 import serial
+import threading
+import time
 
 class pelco_options(object):
     """
@@ -231,12 +236,47 @@ class message():
         msg = [0xFF, camera, command1, command2, data1, data2, checksum]
         return msg 
 
+    def extended(self, camera, command, value):
+        """
+        Creates an extended Pelco D command, whose byte 4 is the command number.
+        
+        Parameters
+        ----------
+        camera : receiver address
+        
+        command : byte 4
+        	 - 0x4B : set pan position
+        	 - 0x4D : set tilt position
+        	 - 0x51 : query pan position
+        	 - 0x53 : query tilt position
+        
+        value : bytes 5 (MSB) and 6 (LSB), a position in hundredths of degree
+        
+        Returns
+        -------
+        msg (type=list) : the 7-bytes command to be sent, including synch byte and checksum
+        """
+        data1 = (value >> 8) & 0xFF
+        data2 = value & 0xFF
+        checksum = (camera + command + data1 + data2) % 256
+        msg = [0xFF, camera, 0x00, command, data1, data2, checksum]
+        return msg
+
 class camera():
     """
     Camera defined by the receiver address and the serial port.
     
     WARNING : once activated, all of the moves described down there will be performed until
-    the stop function is used, except for preset functions.
+    the stop function is used, except for preset and position functions.
+    
+    self.pan and self.tilt are the last position reached with goTo, in degrees.
+    They are None when the position is unknown : during a move, after a move which
+    timed out or was not waited for, after a manual or preset move, a scan, or after stop.
+    
+    self.scan is the camIRTrajectory.trajectory being replayed, if any. It is interrupted
+    before any other command is sent, and self.lock keeps the serial port for one user at a time.
+    self.scanLock makes interrupting a scan and using the port, or starting a new scan,
+    a single step, so that no scan can start in between.
     """
     def __init__(self, port_id, addr):
         self.port_id = port_id
@@ -246,11 +286,18 @@ class camera():
         self.action = pelco_options()
         self.data1 = 0
         self.data2 = 0
+        self.pan = None
+        self.tilt = None
+        self.scan = None
+        self.lock = threading.Lock()
+        self.scanLock = threading.Lock()
 
     def left(self):
         """
         Makes tourelle pan to the left
         """
+        self.pan = None
+        self.tilt = None
         self.action.pan_left = 1
         self.data1 = 0x3F
         self.data2 = 0
@@ -261,6 +308,8 @@ class camera():
         """
         Makes tourelle pan to the right
         """
+        self.pan = None
+        self.tilt = None
         self.action.pan_right = 1
         self.data1 = 0x3F
         self.data2 = 0
@@ -271,6 +320,8 @@ class camera():
         """
         Makes tourelle tilt up
         """
+        self.pan = None
+        self.tilt = None
         self.action.tilt_up = 1
         self.data1 = 0
         self.data2 = 0x3F
@@ -281,6 +332,8 @@ class camera():
         """
         Makes tourelle tilt down
         """
+        self.pan = None
+        self.tilt = None
         self.action.tilt_down = 1
         self.data1 = 0
         self.data2 = 0x3F
@@ -305,6 +358,8 @@ class camera():
         """
         Move the tourelle to the position saved for preset n°number
         """
+        self.pan = None
+        self.tilt = None
         self.action.pan_left = 1
         self.action.pan_right = 1
         self.action.preset = 1
@@ -326,10 +381,122 @@ class camera():
         self.send(self.command.pelcod(self.addr, self.action, self.data1, self.data2), self.port_id)
         self.action = pelco_options()
 
+    def goTo(self, pan, tilt, wait=True, timeout=30, tolerance=0.5):
+        """
+        Move the tourelle to an absolute position.
+        
+        Pan and tilt positions are sent together, in a single write to the serial port.
+        Nothing is sent if the tourelle is known to be at this position already.
+        
+        Parameters
+        ----------
+        pan : pan position in degrees, from 0 to 360
+        
+        tilt : tilt position in degrees, negative values tilt up
+        
+        wait : if True, query the receiver until the position is reached. If False, the
+        position is not known once the command is sent, and a later goTo is always sent.
+        
+        timeout : maximum waiting time in seconds
+        
+        tolerance : maximum error in degrees for the position to be reached
+        
+        Returns
+        -------
+        True if the move is done (or not waited for), False if timeout is reached
+        """
+        pan = pan % 360
+        if self.pan is not None and self.tilt is not None:
+            if abs(pan - self.pan) < 0.01 and abs(tilt - self.tilt) < 0.01:
+                return True
+        pan_msg = self.command.extended(self.addr, 0x4B, round(pan * 100) % 36000)
+        tilt_msg = self.command.extended(self.addr, 0x4D, round(tilt * 100) % 36000)
+        self.pan = None
+        self.tilt = None
+        self.send(pan_msg + tilt_msg, self.port_id)
+        if not wait:
+            return True
+        end = time.time() + timeout
+        while time.time() < end:
+            position = self.position()
+            if position is not None:
+                pan_error = abs((position[0] - pan + 180) % 360 - 180)
+                tilt_error = abs((position[1] - tilt + 180) % 360 - 180)
+                if pan_error <= tolerance and tilt_error <= tolerance:
+                    self.pan = pan
+                    self.tilt = tilt
+                    return True
+            time.sleep(0.1)
+        return False
+
+    def moveBy(self, pan, tilt, wait=True, timeout=30):
+        """
+        Move the tourelle by pan and tilt degrees from its current position.
+        
+        The last position reached with goTo is used if known, else the receiver is queried.
+        
+        Returns
+        -------
+        True if the move is done, False if timeout is reached or position is unknown
+        """
+        if self.pan is None or self.tilt is None:
+            position = self.position()
+            if position is None:
+                return False
+            self.pan, self.tilt = position
+        return self.goTo(self.pan + pan, self.tilt + tilt, wait, timeout)
+
+    def position(self):
+        """
+        Query the receiver for the current position of the tourelle
+        
+        Returns
+        -------
+        (pan, tilt) in degrees, or None if the receiver does not answer
+        """
+        with self.scanLock:
+            self.interruptScan()
+            with self.lock:
+                with serial.Serial(self.port_id, 9600, timeout=0.2) as port_serie:
+                    pan = self.query(port_serie, 0x51, 0x59)
+                    tilt = self.query(port_serie, 0x53, 0x5B)
+        if pan is None or tilt is None:
+            return None
+        if tilt > 180:
+            tilt -= 360
+        return (pan, tilt)
+
+    def query(self, port_serie, command, response):
+        """
+        Sends a query command and reads the answer of the receiver.
+        
+        Parameters
+        ----------
+        port_serie : open serial port
+        
+        command : query command number
+        
+        response : expected byte 4 of the answer
+        
+        Returns
+        -------
+        Position in degrees, or None if the answer is missing or corrupted
+        """
+        port_serie.flushInput()
+        port_serie.write(self.command.extended(self.addr, command, 0))
+        answ = port_serie.read(7)
+        if len(answ) != 7 or answ[0] != 0xFF or answ[3] != response:
+            return None
+        if sum(answ[1:6]) % 256 != answ[6]:
+            return None
+        return ((answ[4] << 8) + answ[5]) / 100
+
     def stop(self):
         """
         Interrupt current move of the tourelle
         """
+        self.pan = None
+        self.tilt = None
         self.send([0xFF, 0x01, 0x00, 0x00, 0x00, 0x00, 0x01], self.port_id)
         self.action = pelco_options()
 
@@ -346,6 +513,19 @@ class camera():
 
         port_id : name of the serial port on which receiver is connected
         """
-        with serial.Serial(port_id, 9600, timeout=1) as port_serie:
-            if port_serie.isOpen():
-                port_serie.write(message)
+        with self.scanLock:
+            self.interruptScan()
+            with self.lock:
+                with serial.Serial(port_id, 9600, timeout=1) as port_serie:
+                    if port_serie.isOpen():
+                        port_serie.write(message)
+
+    def interruptScan(self):
+        """
+        Interrupt the scan being replayed, if any, and wait for the end of its thread.
+        
+        self.scan is read once, as the scan thread clears it when it ends.
+        """
+        scan = self.scan
+        if scan is not None:
+            scan.stop()
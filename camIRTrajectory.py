@@ -0,0 +1,218 @@
+#-*-coding:Utf-8 -*
+
+"""
+    Copyright (C) 2017 Cazé-François Guillaume
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 2 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License along
+    with this program; if not, write to the Free Software Foundation, Inc.,
+    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+This module makes the tourelle follow scan patterns (raster, sector sweep, spiral).
+
+A pattern is a list of moves in degrees. It is compiled once into a timed list of
+Pelco D speed commands, which is then replayed by a dedicated thread, the serial port
+being kept open during the whole scan.
+
+The scan holds the serial port of its camIRPelcoD.camera object : any command sent through
+this object interrupts the scan first.
+
+Each move is done at the maximum speed of its longest axis, the other axis being slowed
+down so that both end together.
+
+Classes
+-------
+trajectory : the compiled scan, and the thread replaying it
+
+Functions
+---------
+raster, sector, spiral : list of moves of each pattern
+
+Example
+-------
+from camIRPelcoD import camera
+from camIRTrajectory import *
+
+tourelle = camera(port_id, receiver_address)
+scan = trajectory(raster(0, 90, 0, 20, 5), tourelle, maxSpeed=30)
+scan.start()
+#...
+scan.stop()
+"""
+
+import threading
+import time
+
+#External library pyserial
+import serial
+
+from camIRPelcoD import message, pelco_options
+
+
+def raster(panStart, panStop, tiltStart, tiltStop, rowStep):
+    """
+    Rows swept alternately left to right and right to left, going down by rowStep
+    degrees between two rows. The tourelle is expected at (panStart, tiltStart).
+
+    Returns
+    -------
+    moves (type=list) : (pan, tilt) relative moves, in degrees
+    """
+    moves = []
+    width = panStop - panStart
+    rows = int(abs(tiltStop - tiltStart) // rowStep) + 1
+    step = rowStep if tiltStop >= tiltStart else -rowStep
+    for row in range(rows):
+        moves.append((width if row % 2 == 0 else -width, 0))
+        if row < rows - 1:
+            moves.append((0, step))
+    return moves
+
+
+def sector(panStart, panStop, passes):
+    """
+    Back and forth sweep between panStart and panStop, at constant tilt.
+    The tourelle is expected at panStart.
+    """
+    width = panStop - panStart
+    return [(width if number % 2 == 0 else -width, 0) for number in range(passes)]
+
+
+def spiral(step, turns):
+    """
+    Square spiral going out from the current position, the distance between
+    two turns being step degrees.
+    """
+    moves = []
+    length = step
+    direction = 1
+    for turn in range(turns):
+        moves.append((direction * length, 0))
+        moves.append((0, direction * length))
+        length += step
+        direction = -direction
+    return moves
+
+
+class trajectory():
+    """
+    Scan compiled into timed Pelco D speed commands.
+
+    Attributes
+    ----------
+    self.tourelle : camIRPelcoD.camera object
+    
+    self.addr : receiver address
+
+    self.maxSpeed : speed of the tourelle at the maximum speed command (0x3F), in degrees per second.
+    It has to be measured for each tourelle.
+
+    self.frames : list of (time in seconds from the start, 7-bytes command)
+
+    self.duration : duration of the whole scan, in seconds
+
+    Functions
+    ---------
+    compile(moves) : builds self.frames from a list of relative moves
+
+    start : replays the scan from a dedicated thread
+
+    stop : interrupts the scan and stops the tourelle
+
+    wait : waits for the end of the scan
+    """
+    def __init__(self, moves, tourelle, maxSpeed):
+        self.tourelle = tourelle
+        self.addr = tourelle.addr
+        self.maxSpeed = maxSpeed
+        self.command = message()
+        self.frames = []
+        self.duration = 0
+        self.thread = None
+        self.interrupt = threading.Event()
+        self.compile(moves)
+
+    def speedFrame(self, panSpeed, tiltSpeed):
+        """
+        Speed command, positive speeds going right and down (from -0x3F to 0x3F).
+        """
+        action = pelco_options()
+        action.pan_right = int(panSpeed > 0)
+        action.pan_left = int(panSpeed < 0)
+        action.tilt_down = int(tiltSpeed > 0)
+        action.tilt_up = int(tiltSpeed < 0)
+        return bytes(self.command.pelcod(self.addr, action, abs(panSpeed), abs(tiltSpeed)))
+
+    def compile(self, moves):
+        self.frames = []
+        clock = 0.0
+        for pan, tilt in moves:
+            longest = max(abs(pan), abs(tilt))
+            if longest == 0:
+                continue
+            panSpeed = int(round(0x3F * pan / longest))
+            tiltSpeed = int(round(0x3F * tilt / longest))
+            frame = self.speedFrame(panSpeed, tiltSpeed)
+            #Consecutive moves in the same direction are merged into a single command
+            if not self.frames or self.frames[-1][1] != frame:
+                self.frames.append((clock, frame))
+            clock += longest / self.maxSpeed
+        self.frames.append((clock, self.speedFrame(0, 0)))
+        self.duration = clock
+
+    def start(self):
+        """
+        The tourelle position known by the camera object is lost, as the scan moves it.
+        """
+        with self.tourelle.scanLock:
+            self.tourelle.interruptScan()
+            self.tourelle.pan = None
+            self.tourelle.tilt = None
+            self.interrupt.clear()
+            self.thread = threading.Thread(target=self.play, daemon=True)
+            self.tourelle.scan = self
+            self.thread.start()
+
+    def stop(self):
+        self.interrupt.set()
+        self.wait()
+
+    def wait(self):
+        if self.thread is not None:
+            self.thread.join()
+
+    def play(self):
+        """
+        Sends each command at its time. The thread sleeps until shortly before the
+        deadline, then waits actively, so the timing does not depend on the
+        resolution of time.sleep.
+        """
+        try:
+            with self.tourelle.lock:
+                with serial.Serial(self.tourelle.port_id, 9600, timeout=1) as port_serie:
+                    begin = time.perf_counter()
+                    for clock, frame in self.frames:
+                        deadline = begin + clock
+                        remaining = deadline - time.perf_counter()
+                        if remaining > 0.002 and self.interrupt.wait(remaining - 0.002):
+                            break
+                        if self.interrupt.is_set():
+                            break
+                        while time.perf_counter() < deadline:
+                            pass
+                        port_serie.write(frame)
+                    if self.interrupt.is_set():
+                        port_serie.write(self.speedFrame(0, 0))
+        finally:
+            if self.tourelle.scan is self:
+                self.tourelle.scan = None
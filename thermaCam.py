@@ -26,12 +26,21 @@ Classes
 thermacam : the thermal camera
 
 imageStocker : the class used to build jpeg image file from buffer
+
+commandScheduler : the thread owning the camera link, sending control commands between
+the blocks of an image transfer
 """
 
 import serial
+import concurrent.futures
+import itertools
 import os
+import queue
+import re
 import sys
+import threading
 import time
+import traceback
 
 class thermacam():
   """
@@ -49,18 +58,36 @@ class thermacam():
   
   self.answ : answer of the camera to a command
   
+  self.shadow : last known settings of the camera (zoom, level, span, autoadj, focus, baudrate).
+  It is read from the camera on connection and updated by each successful command,
+  so commands which would not change anything are not sent. A setting is None when
+  unknown, for example after a failed command. The focus state is only known once a
+  focus command succeeded, and focusStop is always sent.
+  
   Functions
   ---------
   openTest : checks if serial port is open
   
   writeCmd(command) : write specified command to buffer
   
-  errors : checks if the command is correct or not, and if the answer is correct UTF-8
+  errors(answ, command) : checks if the command is correct or not, and if the answer is correct UTF-8.
+  Returns True only if the camera answered with the echo of the command or a prompt
+  
+  readShadow : reads the current settings from the camera. When a commandScheduler is used,
+  it has to be run through it (link.call(cam.readShadow)) : see commandScheduler.getSetting
+  
+  answerTo(command) : answer of the camera, without the echo of the command
+  
+  getSetting(name) : value of a setting, from the shadow only (None if unknown)
   
   maxSpeed : used when the object is created to set communication speed to 115200 bauds
   
   getImage(imageName) : transfer an image file from camera memory to the computer
   
+  transfer(imageName) : same as getImage, yielding the progress after each block
+  
+  listImages : list of the jpeg files stored in camera memory
+  
   getSize(imageName) : used by getImage to get the size of the image to be transfered
   
   saveImage(imageName) : takes a photo of the current image and stores it in camera memory
@@ -81,8 +108,10 @@ class thermacam():
     self.baudrate = 19200
     self.timeout = 0.1
     self.uart = serial.Serial(self.port, self.baudrate, timeout=self.timeout)
-    self.maxSpeed()
+    self.shadow = dict.fromkeys(['zoom', 'level', 'span', 'autoadj', 'focus', 'baudrate'])
     self.answ = ""
+    self.maxSpeed()
+    self.readShadow()
   
   def openTest(self):
     if self.uart.isOpen():
@@ -95,33 +124,87 @@ class thermacam():
     self.openTest()
     self.uart.write(self.message.encode('utf-8'))
     self.answ = self.uart.readall()
-    self.errors(self.answ)
+    success = self.errors(self.answ, message)
     self.uart.close()
+    
+    return(success)
 
-  def errors(self, answ):
+  def errors(self, answ, command=''):
     try:
       answ = answ.decode('utf-8')
-      if answ.find("Error") == -1:
+      if answ.strip() == '':
+        print("No answer\n")
+      elif answ.find("Error") != -1:
+        print("Error\n")
+        print(answ)
+      elif answ.find(command) == -1 and answ.find('>') == -1:
+        print("Unexpected answer\n")
         print(answ)
       else:
-        print("Error\n")
         print(answ)
+        return(True)
     except UnicodeDecodeError:
       print("Not UTF-8\n")
       print(answ)
+    return(False)
             
   def maxSpeed(self):
-    self.writeCmd("baudrate -p 1 115200")
+    success = self.writeCmd("baudrate -p 1 115200")
     self.baudrate = 115200
     self.uart.setBaudrate(115200)
+    self.shadow['baudrate'] = 115200 if success else None
+
+  def readShadow(self):
+    for name, command in (('zoom', 'zoom'), ('level', 'levelt'), ('span', 'spant')):
+      self.shadow[name] = None
+      if self.writeCmd(command):
+        value = re.search(r'\d+(\.\d+)?', self.answerTo(command))
+        if value is not None:
+          self.shadow[name] = float(value.group())
+    self.shadow['autoadj'] = None
+    if self.writeCmd('autoadj'):
+      answ = self.answerTo('autoadj').lower()
+      if 'off' in answ:
+        self.shadow['autoadj'] = 'off'
+      elif 'on' in answ:
+        self.shadow['autoadj'] = 'on'
+
+  def answerTo(self, command):
+    answ = self.answ.decode('utf-8')
+    begin = answ.find(command)
+    if begin == -1:
+      return(answ)
+    return(answ[begin + len(command):])
+
+  def getSetting(self, name):
+    return(self.shadow[name])
 
   def getImage(self, imageName):
+    for progress in self.transfer(imageName):
+      pass
+
+  def transfer(self, imageName):
     self.imageName = imageName
     self.imgSize = self.getSize()
     self.stock = imageStocker(self.imgSize, self.uart, self.imageName)
-    self.stock.buildStocker()
+    for progress in self.stock.blocks():
+      yield progress
     self.stock.buildJPG()
 
+  def listImages(self):
+    self.openTest()
+    self.uart.write('\rls \\images\r'.encode('utf-8'))
+    listOfFiles = self.uart.readall().decode('utf-8')
+    self.uart.close()
+    listOfImages = []
+    for a in listOfFiles.split():
+      if a.endswith('.jpg'):
+        listOfImages.append(a)
+    print(listOfFiles)
+    print(listOfImages)
+    
+    return(listOfImages)
+
   def getSize(self):
     self.openTest()
     self.uart.write('\rcd \images\r'.encode('utf-8'))
@@ -146,32 +229,42 @@ class thermacam():
   
   def focusInf(self):
     message = 'focus -i 25'
-    self.writeCmd(message)
+    self.shadow['focus'] = 'inf' if self.writeCmd(message) else None
     
   def focusClose(self):
     message = 'focus -c 25'
-    self.writeCmd(message)
+    self.shadow['focus'] = 'close' if self.writeCmd(message) else None
     
   def focusStop(self):
     message = 'focus -s'
-    self.writeCmd(message)
+    self.shadow['focus'] = 'stop' if self.writeCmd(message) else None
     
   def zoom(self, zoomPower):
+    if self.shadow['zoom'] == float(zoomPower):
+      return
     message = 'zoom ' + str(zoomPower)
-    self.writeCmd(message)
+    self.shadow['zoom'] = float(zoomPower) if self.writeCmd(message) else None
     
   def setRange(self, tempLow, tempHigh):
-    mediane = 'levelt ' + str((tempLow + tempHigh) / 2 + 273.15)
-    intervalle = 'spant ' + str(tempHigh - tempLow)
-    self.writeCmd("autoadj off")
-    time.sleep(0.1)
-    self.writeCmd(mediane)
-    time.sleep(0.1)
-    self.writeCmd(intervalle)
+    level = (tempLow + tempHigh) / 2 + 273.15
+    span = tempHigh - tempLow
+    if self.shadow['autoadj'] != 'off':
+      self.shadow['autoadj'] = 'off' if self.writeCmd("autoadj off") else None
+      time.sleep(0.1)
+    if self.shadow['level'] is None or abs(self.shadow['level'] - level) > 0.005:
+      self.shadow['level'] = level if self.writeCmd('levelt ' + str(level)) else None
+      time.sleep(0.1)
+    if self.shadow['span'] is None or abs(self.shadow['span'] - span) > 0.005:
+      self.shadow['span'] = span if self.writeCmd('spant ' + str(span)) else None
     
   def autoAdj(self, onOrOff):
+    if self.shadow['autoadj'] == onOrOff:
+      return
     message = 'autoadj ' + onOrOff
-    self.writeCmd(message)
+    self.shadow['autoadj'] = onOrOff if self.writeCmd(message) else None
+    #Level and span are now set by the camera
+    self.shadow['level'] = None
+    self.shadow['span'] = None
 
 
 class imageStocker():
@@ -192,6 +285,10 @@ class imageStocker():
   ---------
   buildStocker : gets and stores each block of the image
   
+  blocks : same as buildStocker, yielding the progress after each block
+  
+  getBlock(blockNumber, length) : gets and stores one block
+  
   buildJPG : dumps stocker into a jpeg file
   """
   def __init__(self, size, uart, name):
@@ -202,47 +299,144 @@ class imageStocker():
     self.progressCounter = 0
 
   def buildStocker(self):
+    for progress in self.blocks():
+      pass
+
+  def blocks(self):
+    """
+    Gets and stores the image block by block, yielding the progress after each block.
+    
+    The serial port is reopened before each block if needed, so other commands
+    can be sent to the camera between two blocks.
+    """
     blockNumber = 0
+    while blockNumber < self.size:
+      length = min(1024, self.size - blockNumber)
+      self.getBlock(blockNumber, length)
+      blockNumber += length
+      self.progressCounter = 100 * (blockNumber / self.size)
+      yield self.progressCounter
+    
+    print(sys.getsizeof(self.stocker))
+    self.uart.close()
+
+  def getBlock(self, blockNumber, length):
     j = 0
-    part = b''
-    reste = self.size % 1024    
     if self.uart.isOpen():
       pass
     else:
       self.uart.open()
     
-    while blockNumber  < (self.size - reste):
-      j = 0 
-      message = "\rgetfblock \"\images\\" + self.name + "\" " + str(blockNumber) + " 1024 \r"
-      print(message)
-      self.uart.write(message.encode('utf-8'))
-      time.sleep(0.1)
-      part = self.uart.readall()
-      while part[j] != 0x00:
-        j += 1
-      j += 3
-
-      self.stocker += part[j:(1024+j)]
-      self.progressCounter = 100 * (blockNumber / self.size)
-      blockNumber += 1024
-      
-      
-    
-    j = 0
-    message = "\rgetfblock \"\images\\" + self.name + "\" " + str(blockNumber) + ' ' + str(reste) + " \r"
+    message = "\rgetfblock \"\images\\" + self.name + "\" " + str(blockNumber) + ' ' + str(length) + " \r"
+    print(message)
     self.uart.write(message.encode('utf-8'))
     time.sleep(0.1)
     part = self.uart.readall()
     while part[j] != 0x00:
       j += 1
     j += 3
-    self.stocker += part[j:(reste+j)]
-    self.progressCounter = 100
-    print(message)
-    print(sys.getsizeof(self.stocker))
-    self.uart.close()
+    self.stocker += part[j:(length+j)]
 
   def buildJPG(self):
     with open(self.name, 'wb') as JPGFile:
       JPGFile.write(self.stocker)
 
+
+class commandScheduler():
+  """
+  This class owns the link with the camera : every command is run by a single thread,
+  so that commands sent during an image transfer do not corrupt it.
+  
+  Control commands have priority over transfers. A transfer is run block by block, and
+  the pending control commands are sent between two blocks : a control command waits
+  at most for the end of the current block (about 0.2 s).
+  
+  The error of a failed task is printed, even if nobody reads its Future.
+  
+  Attributes
+  ----------
+  self.cam : thermacam object
+  
+  self.queue : priority queue of the pending tasks
+  
+  self.progressCounter : progress of the current transfer, in %
+  
+  Functions
+  ---------
+  submit(function, *args) : queues a control command, returns a Future
+  
+  call(function, *args) : queues a control command and waits for its result
+  
+  getImage(imageName) : queues an image transfer, returns a Future
+  
+  getSetting(name) : value of a camera setting, read from the camera through the queue if unknown
+  
+  close : stops the thread once the pending tasks are done
+  
+  Example
+  -------
+  link = commandScheduler(thermacam(port))
+  link.getImage('img1.jpg')
+  link.submit(link.cam.focusStop)
+  """
+  CONTROL = 0
+  TRANSFER = 1
+  CLOSE = 2
+  
+  def __init__(self, cam):
+    self.cam = cam
+    self.queue = queue.PriorityQueue()
+    self.order = itertools.count()
+    self.progressCounter = 0
+    self.thread = threading.Thread(target=self.run, daemon=True)
+    self.thread.start()
+
+  def submit(self, function, *args):
+    job = concurrent.futures.Future()
+    job.add_done_callback(self.report)
+    self.queue.put((self.CONTROL, next(self.order), function, args, job))
+    return job
+
+  def call(self, function, *args):
+    return self.submit(function, *args).result()
+
+  def getSetting(self, name):
+    if self.cam.getSetting(name) is None:
+      self.call(self.cam.readShadow)
+    return(self.cam.getSetting(name))
+
+  def getImage(self, imageName):
+    job = concurrent.futures.Future()
+    job.add_done_callback(self.report)
+    self.queue.put((self.TRANSFER, next(self.order), self.cam.transfer(imageName), (), job))
+    return job
+
+  def report(self, job):
+    if not job.cancelled() and job.exception() is not None:
+      error = job.exception()
+      print("Error in camera task\n")
+      traceback.print_exception(type(error), error, error.__traceback__)
+
+  def close(self):
+    self.queue.put((self.CLOSE, next(self.order), None, (), None))
+    self.thread.join()
+
+  def run(self):
+    while True:
+      priority, order, task, args, job = self.queue.get()
+      if priority == self.CLOSE:
+        break
+      if not job.running() and not job.set_running_or_notify_cancel():
+        continue
+      try:
+        if priority == self.TRANSFER:
+          self.progressCounter = next(task)
+          #Back in the queue with its first order, so it goes on before any later transfer
+          self.queue.put((priority, order, task, args, job))
+        else:
+          job.set_result(task(*args))
+      except StopIteration:
+        self.progressCounter = 100
+        job.set_result(self.cam.imageName)
+      except Exception as error:
+        job.set_exception(error)
@@ -0,0 +1,260 @@
+#-*-coding:Utf-8 -*
+
+"""
+    Copyright (C) 2017 Cazé-François Guillaume
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 2 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License along
+    with this program; if not, write to the Free Software Foundation, Inc.,
+    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+This module computes thermal statistics on a batch of jpeg images transfered with
+thermacam.getImage.
+
+The images are decoded in a pool of processes, one per core by default, and the statistics
+are computed with NumPy. Results are written into a CSV file row by row, as soon as each
+image is done, or into a Parquet file, readable once the whole batch is done.
+
+An image which cannot be decoded (a truncated transfer for example) does not stop the batch :
+its row only gives the image name and the error.
+
+Pixel values are grey levels (0 - 255). If the temperature range used when the images were
+taken is given (see thermacam.setRange), they are converted linearly to °C.
+
+Classes
+-------
+batchAnalyser : the batch of images to be analysed
+
+Functions
+---------
+analyseImage(path) : statistics of one image, run by the worker processes
+
+Example
+-------
+python3 thermaStats.py images/*.jpg -o stats.csv --range 10 60 --threshold 45 --reference ref.jpg
+"""
+
+import argparse
+import csv
+import multiprocessing
+import os
+
+#External libraries numpy and pillow
+import numpy as np
+from PIL import Image
+
+FIELDS = ['image', 'min', 'max', 'mean', 'hotspotX', 'hotspotY',
+          'aboveThreshold', 'meanDelta', 'changedPixels', 'error']
+
+#Settings of the worker processes, filled once by initWorker
+_settings = {}
+
+
+def loadImage(path, tempRange=None):
+    """
+    Decodes a jpeg image into a 2D float32 array.
+
+    Parameters
+    ----------
+    path : path of the jpeg file
+
+    tempRange : (low, high) temperatures of the image in °C, or None to keep grey levels
+
+    Returns
+    -------
+    pixels (type=numpy.ndarray) : grey levels, or temperatures if tempRange is given
+    """
+    with Image.open(path) as img:
+        pixels = np.asarray(img.convert('L'), dtype=np.float32)
+    if tempRange is not None:
+        low, high = tempRange
+        pixels = low + pixels * ((high - low) / 255.0)
+    return pixels
+
+
+def initWorker(tempRange, threshold, reference, delta):
+    """
+    Stores the settings in each worker process, so the reference frame, already
+    decoded by the main process, is sent once per process instead of once per image.
+    """
+    _settings['tempRange'] = tempRange
+    _settings['threshold'] = threshold
+    _settings['reference'] = reference
+    _settings['delta'] = delta
+
+
+def analyseImage(path):
+    """
+    Computes the statistics of one image.
+
+    Parameters
+    ----------
+    path : path of the jpeg file
+
+    Returns
+    -------
+    row (type=dict) : one value per field of FIELDS. Fields needing a threshold or a
+    reference frame are None when these were not given. If the image cannot be decoded,
+    only the image and error fields are given. If its size differs from the reference frame,
+    the comparison is skipped and explained in the error field.
+    """
+    row = dict.fromkeys(FIELDS)
+    row['image'] = os.path.basename(path)
+    try:
+        pixels = loadImage(path, _settings.get('tempRange'))
+    except (OSError, ValueError) as error:
+        row['error'] = str(error)
+        return row
+    hotspot = np.unravel_index(np.argmax(pixels), pixels.shape)
+    row['min'] = float(pixels.min())
+    row['max'] = float(pixels.max())
+    row['mean'] = float(pixels.mean())
+    row['hotspotX'] = int(hotspot[1])
+    row['hotspotY'] = int(hotspot[0])
+
+    threshold = _settings.get('threshold')
+    if threshold is not None:
+        row['aboveThreshold'] = int(np.count_nonzero(pixels > threshold))
+
+    reference = _settings.get('reference')
+    if reference is not None and reference.shape != pixels.shape:
+        row['error'] = ("reference frame size " + str(reference.shape)
+                        + " differs from image size " + str(pixels.shape))
+    elif reference is not None:
+        difference = np.abs(pixels - reference)
+        row['meanDelta'] = float(difference.mean())
+        row['changedPixels'] = int(np.count_nonzero(difference > _settings['delta']))
+    return row
+
+
+class batchAnalyser():
+    """
+    Batch of images analysed by a pool of processes.
+
+    Attributes
+    ----------
+    self.paths : list of the jpeg files to be analysed
+
+    self.tempRange : (low, high) temperatures of the images in °C, or None
+
+    self.threshold : alarm threshold, in the same unit as the pixels
+
+    self.reference : path of the reference frame, or None
+
+    self.delta : minimal difference with the reference frame for a pixel to count as changed
+
+    self.processes : number of worker processes, default is the number of cores
+
+    self.progressCounter : number of images already written
+
+    Functions
+    ---------
+    results : yields the statistics of each image as soon as they are ready
+
+    toCSV(fileName) : writes the statistics into a CSV file
+
+    toParquet(fileName) : writes the statistics into a Parquet file (needs pyarrow)
+
+    save(fileName) : chooses the format from the file extension
+    """
+    def __init__(self, paths, tempRange=None, threshold=None, reference=None, delta=2.0,
+                 processes=None):
+        self.paths = list(paths)
+        self.tempRange = tempRange
+        self.threshold = threshold
+        self.reference = reference
+        self.delta = delta
+        self.processes = processes or os.cpu_count() or 1
+        self.progressCounter = 0
+
+    def results(self):
+        """
+        Yields one row per image, in the order of self.paths.
+
+        Images are sent to the workers in chunks, so that the pool stays busy
+        without a round trip per image.
+
+        The reference frame is decoded here, before starting the pool, so that a missing
+        or unreadable reference raises at once instead of killing each worker.
+        """
+        reference = None
+        if self.reference is not None:
+            reference = loadImage(self.reference, self.tempRange)
+        chunk = max(1, len(self.paths) // (self.processes * 8))
+        initargs = (self.tempRange, self.threshold, reference, self.delta)
+        with multiprocessing.Pool(self.processes, initWorker, initargs) as pool:
+            for row in pool.imap(analyseImage, self.paths, chunk):
+                self.progressCounter += 1
+                yield row
+
+    def toCSV(self, fileName):
+        with open(fileName, 'w', newline='') as csvFile:
+            writer = csv.DictWriter(csvFile, fieldnames=FIELDS)
+            writer.writeheader()
+            for row in self.results():
+                writer.writerow(row)
+                csvFile.flush()
+
+    def toParquet(self, fileName, rowGroup=256):
+        """
+        Writes the rows by groups of rowGroup images, so the rows are not all kept
+        in memory. The file is only readable once closed, at the end of the batch.
+        """
+        #Optional external library pyarrow
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.schema([('image', pa.string()),
+                            ('min', pa.float64()),
+                            ('max', pa.float64()),
+                            ('mean', pa.float64()),
+                            ('hotspotX', pa.int32()),
+                            ('hotspotY', pa.int32()),
+                            ('aboveThreshold', pa.int64()),
+                            ('meanDelta', pa.float64()),
+                            ('changedPixels', pa.int64()),
+                            ('error', pa.string())])
+        rows = []
+        with pq.ParquetWriter(fileName, schema) as writer:
+            for row in self.results():
+                rows.append(row)
+                if len(rows) == rowGroup:
+                    writer.write_table(pa.Table.from_pylist(rows, schema))
+                    rows = []
+            if rows:
+                writer.write_table(pa.Table.from_pylist(rows, schema))
+
+    def save(self, fileName):
+        if fileName.endswith('.parquet'):
+            self.toParquet(fileName)
+        else:
+            self.toCSV(fileName)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Thermal statistics of a batch of jpeg images")
+    parser.add_argument('images', nargs='+', help="jpeg files to be analysed")
+    parser.add_argument('-o', '--output', default='stats.csv', help="CSV or .parquet output file")
+    parser.add_argument('--range', nargs=2, type=float, metavar=('LOW', 'HIGH'),
+                        help="temperature range of the images, in °C")
+    parser.add_argument('--threshold', type=float, help="alarm threshold")
+    parser.add_argument('--reference', help="reference frame")
+    parser.add_argument('--delta', type=float, default=2.0,
+                        help="minimal change against the reference frame")
+    parser.add_argument('-j', '--processes', type=int, help="number of worker processes")
+    args = parser.parse_args()
+
+    batch = batchAnalyser(args.images, args.range, args.threshold, args.reference,
+                          args.delta, args.processes)
+    batch.save(args.output)
+    print(str(batch.progressCounter) + " images analysed")